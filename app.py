@@ -1,11 +1,21 @@
 import dash
-from dash import dcc, html, Input, Output
+from dash import dcc, html, Input, Output, State, MATCH
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import dash_leaflet as dl
+from dash_extensions.javascript import arrow_function, assign
 import geopandas as gpd
 import pandas as pd
-import json
+import numpy as np
+import os
+import hashlib
+import geobuf
+from functools import lru_cache
 import branca.colormap as cm
+from shapely.geometry import mapping
+import plotly.io as pio
+
+from to_parquet import RUTA_DF_MERGE_PARQUET, construir_df_merge
 
 # =============================
 #   Mortalidad en Antioquia – Dash
@@ -13,29 +23,96 @@ import branca.colormap as cm
 
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 server = app.server
+# Los mapas de assets/ se pueden reutilizar desde la caché del navegador
+# durante una hora
+server.config["SEND_FILE_MAX_AGE_DEFAULT"] = 3600
+
+# Dash serializa las respuestas de los callbacks con el codificador JSON de
+# plotly; orjson es varias veces más rápido con el GeoJSON de los mapas
+pio.json.config.default_engine = "orjson"
 
 # -----------------------------------------------------------
-# Lectura de datos (igual que en tu código original)
+# Lectura de datos (GeoParquet de to_parquet.py o archivos originales)
 # -----------------------------------------------------------
-# Dataset de mortalidad
-dataset_final = pd.read_csv("datos/Mortalidad_General_en_el_departamento_de_Antioquia.csv")
+# Se usa el df_merge guardado por to_parquet.py cuando existe; si no, se
+# leen el CSV y el shapefile originales y se hace el merge.
+if os.path.exists(RUTA_DF_MERGE_PARQUET):
+    df_merge = gpd.read_parquet(RUTA_DF_MERGE_PARQUET)
+else:
+    df_merge = construir_df_merge()
+
+lista_anios = sorted(df_merge["Año"].unique()) + ["Todos los años"]
 
-# Convertir el código de municipio a string para merge
-dataset_final["CodigoMunicipio"] = dataset_final["CodigoMunicipio"].astype(str)
+# -----------------------------------------------------------
+# Agregados precalculados por año
+# -----------------------------------------------------------
+# Códigos enteros por municipio (-1 para los municipios sin datos), para
+# reducir sobre arreglos de numpy en lugar de hacer hash de textos y
+# geometrías en un groupby
+CODIGOS, MUNICIPIOS = pd.factorize(df_merge["CodigoMunicipio"])
+# Primera fila de cada municipio, de donde salen nombre, región y geometría
+_codigos_unicos, _primera_fila = np.unique(CODIGOS, return_index=True)
+PRIMERA_FILA = _primera_fila[_codigos_unicos >= 0]
 
-# Shapefile de municipios
-shapefile = gpd.read_file("datos/MGN2021_MPIO_POLITICO/MGN_MPIO_POLITICO.shp")
 
-# Hacer merge con geopandas
-df_merge = shapefile.merge(
-    dataset_final,
-    left_on="MPIO_CCDGO",
-    right_on="CodigoMunicipio",
-    how="left"
-)
+def group_reduce(codes, vals, ngroups, agg):
+    valido = codes >= 0
+    suma = np.bincount(codes[valido], weights=vals[valido], minlength=ngroups)
+    if agg == "sum":
+        return suma
+    conteo = np.bincount(codes[valido], minlength=ngroups)
+    return suma / conteo
+
+
+# Filas de cada año, separadas una sola vez en lugar de comparar la columna
+# Año completa por cada año y métrica
+BY_YEAR = dict(iter(df_merge.groupby("Año")))
+
+
+# df_merge no cambia después de la carga, así que cada combinación
+# (año, métrica) se calcula una sola vez al iniciar y los callbacks
+# solo hacen una búsqueda en el diccionario.
+def build_agg_cache():
+    cache = {}
+    for anio in lista_anios:
+        for metrica, agg in [("TasaXMilHabitantes", "mean"), ("NumeroCasos", "sum")]:
+            if anio == "Todos los años":
+                df = df_merge.iloc[PRIMERA_FILA][
+                    ["NombreMunicipio", "CodigoMunicipio", "NombreRegion", "geometry"]
+                ].reset_index(drop=True)
+                df[metrica] = group_reduce(
+                    CODIGOS, df_merge[metrica].to_numpy(dtype=float), len(MUNICIPIOS), agg
+                )
+            else:
+                df = BY_YEAR[anio]
+            cache[(anio, metrica)] = df
+    return cache
+
+
+AGG_CACHE = build_agg_cache()
+
+# GeoJSON armado directamente desde los arreglos de columnas, sin el
+# recorrido fila por fila de GeoDataFrame.iterfeatures, y solo con las
+# propiedades que usan los mapas. La precisión de las coordenadas la fija
+# después geobuf al codificar (5 decimales)
+def fast_geo_json(gdf, prop_cols):
+    props = [dict(zip(prop_cols, fila)) for fila in gdf[prop_cols].to_numpy(dtype=object)]
+    features = [
+        {"type": "Feature", "geometry": mapping(geom), "properties": p}
+        for geom, p in zip(gdf.geometry.values, props)
+    ]
+    return {"type": "FeatureCollection", "features": features}
+
+
+# Texto del tooltip ("Municipio: valor") formateado para toda la columna de
+# una vez: la tasa con 2 decimales y los casos como entero
+def texto_tooltip(df, metrica):
+    if metrica == "TasaXMilHabitantes":
+        valores = df[metrica].round(2).astype(str)
+    else:
+        valores = df[metrica].astype(int).astype(str)
+    return df["NombreMunicipio"].astype(str) + ": " + valores
 
-# Asegurar que es un GeoDataFrame válido
-df_merge = gpd.GeoDataFrame(df_merge, geometry="geometry", crs="EPSG:4326")
 
 # -----------------------------------------------------------
 # Layout
@@ -47,139 +124,176 @@ app.layout = dbc.Container([
         dbc.Col([
             html.Label("Seleccione el año (Tasa por mil)"),
             dcc.Dropdown(
-                id="anio_tasa",
-                options=[{"label": str(anio), "value": anio} for anio in sorted(dataset_final["Año"].unique())] +
-                        [{"label": "Todos los años", "value": "Todos los años"}],
-                value="Todos los años"
+                id={"type": "anio", "metrica": "tasa"},
+                options=[{"label": str(anio), "value": anio} for anio in lista_anios],
+                value="Todos los años",
+                clearable=False
             ),
-            html.Div(id="mapa_tasa")
+            dcc.Loading(html.Div(id={"type": "mapa", "metrica": "tasa"}))
         ], md=6),
 
         dbc.Col([
             html.Label("Seleccione el año (Número de casos)"),
             dcc.Dropdown(
-                id="anio_casos",
-                options=[{"label": str(anio), "value": anio} for anio in sorted(dataset_final["Año"].unique())] +
-                        [{"label": "Todos los años", "value": "Todos los años"}],
-                value="Todos los años"
+                id={"type": "anio", "metrica": "casos"},
+                options=[{"label": str(anio), "value": anio} for anio in lista_anios],
+                value="Todos los años",
+                clearable=False
             ),
-            html.Div(id="mapa_casos")
+            dcc.Loading(html.Div(id={"type": "mapa", "metrica": "casos"}))
         ], md=6)
     ])
 ], fluid=True)
 
 # -----------------------------------------------------------
-# Callback: mapa de Tasa
+# Callback: mapas de Tasa y Casos
 # -----------------------------------------------------------
-@app.callback(
-    Output("mapa_tasa", "children"),
-    Input("anio_tasa", "value")
-)
-def update_mapa_tasa(anio):
-    if anio == "Todos los años":
-        df = df_merge.groupby(
-            ["NombreMunicipio", "CodigoMunicipio", "NombreRegion", "geometry"]
-        ).agg({"TasaXMilHabitantes": "mean"}).reset_index()
-    else:
-        df = df_merge[df_merge["Año"] == anio]
+# Ambos mapas solo difieren en la columna, la escala de color, la leyenda y
+# el color de resaltado
+MAPAS = {
+    "tasa": {
+        "columna": "TasaXMilHabitantes",
+        "colormap": cm.linear.YlOrRd_09,
+        "caption": "Tasa por mil",
+        "hover": "red",
+    },
+    "casos": {
+        "columna": "NumeroCasos",
+        "colormap": cm.linear.OrRd_09,
+        "caption": "Número de casos",
+        "hover": "blue",
+    },
+}
 
-    df = gpd.GeoDataFrame(df, geometry="geometry", crs="EPSG:4326")
-    geojson = json.loads(df.to_json())
+# Escala de color de cada (métrica, año), ya ajustada al mínimo y máximo
+# del año para no recorrer la columna en cada render
+CMAP_CACHE = {
+    (metrica, anio): config["colormap"].scale(
+        AGG_CACHE[(anio, config["columna"])][config["columna"]].min(),
+        AGG_CACHE[(anio, config["columna"])][config["columna"]].max(),
+    )
+    for metrica, config in MAPAS.items()
+    for anio in lista_anios
+}
 
-    values = df["TasaXMilHabitantes"]
-    min_val, max_val = values.min(), values.max()
-    cmap = cm.linear.YlOrRd_09.scale(min_val, max_val)
 
-    def style_function(feature):
-        valor = feature["properties"].get("TasaXMilHabitantes")
-        return {
-            "fillColor": cmap(valor) if valor is not None else "transparent",
-            "color": "black",
-            "weight": 1,
-            "fillOpacity": 0.7,
-        }
+# Color de relleno de cada municipio, guardado en las propiedades del
+# GeoJSON para que el navegador lo lea sin llamar de vuelta a Python
+def color_relleno(valores, cmap):
+    return [cmap(valor) if pd.notna(valor) else "transparent" for valor in valores]
 
-    def on_each_feature(feature, layer):
-        municipio = feature["properties"].get("NombreMunicipio", "")
-        valor = feature["properties"].get("TasaXMilHabitantes", "")
-        layer.bindTooltip(f"{municipio}: {round(valor, 2)}")
 
-    choropleth = dl.GeoJSON(
-        data=geojson,
-        id="geojson_tasa",
-        zoomToBounds=True,
-        options=dict(style=style_function),
-        hoverStyle={"weight": 3, "color": "red", "fillOpacity": 0.9},
-        onEachFeature=on_each_feature,
+# GeoJSON de cada (métrica, año), armado una sola vez; solo lleva el texto
+# del tooltip y el color, que es lo único que lee el navegador
+GEOJSON_CACHE = {}
+for (metrica, anio), cmap in CMAP_CACHE.items():
+    columna = MAPAS[metrica]["columna"]
+    df = AGG_CACHE[(anio, columna)]
+    GEOJSON_CACHE[(metrica, anio)] = fast_geo_json(
+        df.assign(
+            _tooltip=texto_tooltip(df, columna),
+            _fill=color_relleno(df[columna], cmap),
+        ),
+        ["_tooltip", "_fill"],
     )
 
-    return dl.Map(
-        children=[
-            dl.TileLayer(),
-            choropleth,
-            cmap.to_step(index=[min_val, max_val], caption="Tasa por mil", width=20, height=150),
-        ],
-        style={"width": "100%", "height": "600px"},
-        center=[6.5, -75.5],
-        zoom=7,
-    )
 
-# -----------------------------------------------------------
-# Callback: mapa de Casos
-# -----------------------------------------------------------
-@app.callback(
-    Output("mapa_casos", "children"),
-    Input("anio_casos", "value")
-)
-def update_mapa_casos(anio):
-    if anio == "Todos los años":
-        df = df_merge.groupby(
-            ["NombreMunicipio", "CodigoMunicipio", "NombreRegion", "geometry"]
-        ).agg({"NumeroCasos": "sum"}).reset_index()
-    else:
-        df = df_merge[df_merge["Año"] == anio]
+# GeoJSON de cada (métrica, año) escrito como archivo estático en assets/:
+# el navegador lo descarga directamente y el callback solo envía la URL.
+# Se guarda en geobuf (binario, coordenadas como enteros delta con 5
+# decimales), unas 5 veces más liviano que el texto GeoJSON
+def nombre_geobuf(metrica, anio):
+    return f"{metrica}_{'todos' if anio == 'Todos los años' else anio}.pbf"
+
 
-    df = gpd.GeoDataFrame(df, geometry="geometry", crs="EPSG:4326")
-    geojson = json.loads(df.to_json())
+# Versión de cada archivo (hash del contenido) para la URL: si los datos
+# cambian en un nuevo despliegue, el navegador no reutiliza la copia vieja
+VERSION_GEOBUF = {}
 
-    values = df["NumeroCasos"]
-    min_val, max_val = values.min(), values.max()
-    cmap = cm.linear.OrRd_09.scale(min_val, max_val)
+os.makedirs(app.config.assets_folder, exist_ok=True)
+for metrica in MAPAS:
+    for anio in lista_anios:
+        ruta = os.path.join(app.config.assets_folder, nombre_geobuf(metrica, anio))
+        contenido = geobuf.encode(GEOJSON_CACHE[(metrica, anio)], 5)
+        VERSION_GEOBUF[(metrica, anio)] = hashlib.sha1(contenido).hexdigest()[:12]
+        # Escritura atómica: otro proceso que arranque a la vez nunca ve un
+        # archivo a medio escribir
+        ruta_tmp = f"{ruta}.{os.getpid()}.tmp"
+        with open(ruta_tmp, "wb") as f:
+            f.write(contenido)
+        os.replace(ruta_tmp, ruta)
 
-    def style_function(feature):
-        valor = feature["properties"].get("NumeroCasos")
-        return {
-            "fillColor": cmap(valor) if valor is not None else "transparent",
-            "color": "black",
-            "weight": 1,
-            "fillOpacity": 0.7,
-        }
+# Estilo resuelto en el navegador a partir de _fill
+ESTILO_MAPA = assign("""function(feature) {
+    return {fillColor: feature.properties._fill, color: "black", weight: 1, fillOpacity: 0.7};
+}""")
 
-    def on_each_feature(feature, layer):
-        municipio = feature["properties"].get("NombreMunicipio", "")
-        valor = feature["properties"].get("NumeroCasos", "")
-        layer.bindTooltip(f"{municipio}: {valor}")
+# Tooltip con el texto ya formateado en _tooltip
+TOOLTIP_MAPA = assign("""function(feature, layer) {
+    layer.bindTooltip(feature.properties._tooltip);
+}""")
+
+
+# Las salidas de los mapas solo dependen de (métrica, año), así que se
+# guardan en memoria y cada render repetido entrega el mismo objeto sin
+# volver a construirlo (Dash igual lo serializa en cada respuesta)
+@lru_cache(maxsize=64)
+def render_mapa(metrica, anio):
+    config = MAPAS[metrica]
+    cmap = CMAP_CACHE[(metrica, anio)]
 
     choropleth = dl.GeoJSON(
-        data=geojson,
-        id="geojson_casos",
-        zoomToBounds=True,
-        options=dict(style=style_function),
-        hoverStyle={"weight": 3, "color": "blue", "fillOpacity": 0.9},
-        onEachFeature=on_each_feature,
+        url=app.get_asset_url(nombre_geobuf(metrica, anio)) + f"?v={VERSION_GEOBUF[(metrica, anio)]}",
+        format="geobuf",
+        id=f"geojson_{metrica}",
+        style=ESTILO_MAPA,
+        hoverStyle=arrow_function({"weight": 3, "color": config["hover"], "fillOpacity": 0.9}),
+        onEachFeature=TOOLTIP_MAPA,
     )
 
     return dl.Map(
         children=[
             dl.TileLayer(),
             choropleth,
-            cmap.to_step(index=[min_val, max_val], caption="Número de casos", width=20, height=150),
+            dl.Colorbar(
+                colorscale=[cmap.rgb_hex_str(v) for v in cmap.index],
+                min=cmap.vmin,
+                max=cmap.vmax,
+                width=20,
+                height=150,
+                position="bottomleft",
+            ),
+            # Título de la leyenda, justo encima de la barra de colores
+            html.Div(
+                config["caption"],
+                style={
+                    "position": "absolute",
+                    "bottom": "175px",
+                    "left": "10px",
+                    "zIndex": 1000,
+                    "background": "white",
+                    "padding": "2px 6px",
+                    "fontSize": "12px",
+                },
+            ),
         ],
         style={"width": "100%", "height": "600px"},
         center=[6.5, -75.5],
         zoom=7,
     )
 
+
+@app.callback(
+    Output({"type": "mapa", "metrica": MATCH}, "children"),
+    Input({"type": "anio", "metrica": MATCH}, "value"),
+    State({"type": "anio", "metrica": MATCH}, "id"),
+)
+def update_mapa(anio, id_dropdown):
+    # Sin año elegido no hay mapa precalculado; se deja el mapa anterior
+    if anio is None:
+        raise PreventUpdate
+    return render_mapa(id_dropdown["metrica"], anio)
+
 # -----------------------------------------------------------
 # Run
 # -----------------------------------------------------------
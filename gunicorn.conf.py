@@ -0,0 +1,11 @@
+# =============================
+#   Configuración de gunicorn (gunicorn app:server)
+# =============================
+# Con preload_app los datos y cachés que app.py arma al importarse se
+# construyen una sola vez en el proceso padre y los workers los comparten
+# por copy-on-write, en lugar de volver a leerlos cada uno.
+
+preload_app = True
+workers = 2
+worker_class = "gthread"
+threads = 4
@@ -0,0 +1,77 @@
+# =============================
+#   Conversión de datos a Parquet
+# =============================
+# Se ejecuta una sola vez (o en el build de Render) para que app.py no
+# tenga que volver a parsear el CSV y el shapefile ni repetir el merge en
+# cada arranque:
+#
+#   python to_parquet.py
+
+import geopandas as gpd
+import pandas as pd
+
+RUTA_DATASET = "data/Mortalidad_General_en_el_departamento_de_Antioquia_desde_2005_20250915.csv"
+RUTA_SHAPEFILE = "data/MGN_MPIO_POLITICO.shp"
+
+RUTA_DF_MERGE_PARQUET = "data/df_merge.parquet"
+
+# Tipos compactos del dataset de mortalidad: categorías para los textos
+# repetidos y enteros/flotantes de 16-32 bits para los valores
+TIPOS_DATASET = {
+    "NombreMunicipio": "category",
+    "NombreRegion": "category",
+    "CodigoMunicipio": "category",
+    "Año": "int16",
+    "NumeroCasos": "int32",
+    "TasaXMilHabitantes": "float32",
+}
+
+
+def leer_dataset():
+    return pd.read_csv(RUTA_DATASET, dtype={"CodigoMunicipio": str}).astype(TIPOS_DATASET)
+
+
+def leer_shapefile():
+    # Solo los municipios de Antioquia (código DANE 05xxx) y las columnas que
+    # usa la app; el filtro se resuelve en el lector (pyogrio) sin cargar el
+    # resto del país
+    shapefile = gpd.read_file(
+        RUTA_SHAPEFILE,
+        engine="pyogrio",
+        columns=["MPIO_CDPMP", "MPIO_CNMBR"],
+        where="MPIO_CDPMP LIKE '05%'",
+    ).to_crs(4326)
+
+    # Los límites a escala metro no se notan en el mapa del departamento;
+    # simplificar reduce ~25 veces los vértices que viajan al navegador
+    shapefile["geometry"] = shapefile.geometry.simplify(0.001, preserve_topology=True)
+    return shapefile
+
+
+def construir_df_merge():
+    dataset_final = leer_dataset()
+    shapefile = leer_shapefile()
+
+    # Ambas llaves con las mismas categorías, para que el merge compare los
+    # códigos enteros de la categoría y no los textos
+    codigos_dane = pd.CategoricalDtype(
+        sorted(set(dataset_final["CodigoMunicipio"]) | set(shapefile["MPIO_CDPMP"]))
+    )
+    dataset_final["CodigoMunicipio"] = dataset_final["CodigoMunicipio"].astype(codigos_dane)
+    shapefile["MPIO_CDPMP"] = shapefile["MPIO_CDPMP"].astype(codigos_dane)
+
+    # Hacer merge con geopandas (código DANE de 5 dígitos); cada municipio del
+    # shapefile aparece una sola vez y tiene una fila por año en el dataset.
+    # El resultado ya es un GeoDataFrame con el CRS del shapefile
+    return shapefile.merge(
+        dataset_final,
+        left_on="MPIO_CDPMP",
+        right_on="CodigoMunicipio",
+        how="left",
+        validate="one_to_many",
+    )
+
+
+if __name__ == "__main__":
+    # df_merge completo como GeoParquet (geometrías en WKB, tipos conservados)
+    construir_df_merge().to_parquet(RUTA_DF_MERGE_PARQUET, compression="zstd")